@@ -2,253 +2,342 @@ import subprocess
 import sys
 import os
 import re
+import functools
+import hashlib
+import itertools
+import json
+import shutil
+import string
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Define the scale intervals for different scale types
+SCALE_INTERVALS = {
+    "major": [2, 2, 1, 2, 2, 2, 1],
+    "minor": [2, 1, 2, 2, 1, 2, 2]  # Natural Minor Scale
+}
+
+# Scale types to generate
+SCALE_TYPES = ["major", "minor"]
+
+# Define flat keys for reference
+FLAT_KEYS = ['f', 'bb', 'eb', 'ab', 'db', 'gb', 'cb']
+FLAT_KEY_SET = frozenset(FLAT_KEYS)
+
+# Define note orders for sharp and flat contexts
+NOTE_ORDER_SHARP = ('c', 'c#', 'd', 'd#', 'e', 'f', 'f#', 'g', 'g#', 'a', 'a#', 'b')
+NOTE_ORDER_FLAT = ('c', 'db', 'd', 'eb', 'e', 'f', 'gb', 'g', 'ab', 'a', 'bb', 'b')
+
+# Enharmonic spellings that may be missing from one of the note orders
+ENHARMONIC = {
+    'cb': 'b', 'fb': 'e', 'db': 'c#', 'eb': 'd#', 'gb': 'f#', 'ab': 'g#', 'bb': 'a#',
+    'e#': 'f', 'b#': 'c'
+}
+
+def build_note_index(note_order):
+    """
+    Builds a note -> index lookup table for a note order, with enharmonic
+    equivalents folded in so every lookup is a single dict access.
+
+    Args:
+        note_order (tuple): The chromatic notes (sharps or flats).
 
-def generate_and_compile_scales(key, octaves):
+    Returns:
+        dict: Mapping of note name to its index in note_order.
     """
-    Generates multiple scales in LilyPond format based on the specified key and number of octaves.
-    Compiles the LilyPond file into PDF and MIDI formats.
+    note_index = {n: i for i, n in enumerate(note_order)}
+    for alias, target in ENHARMONIC.items():
+        if alias not in note_index and target in note_index:
+            note_index[alias] = note_index[target]
+    return note_index
+
+NOTE_INDEX_SHARP = build_note_index(NOTE_ORDER_SHARP)
+NOTE_INDEX_FLAT = build_note_index(NOTE_ORDER_FLAT)
+
+# LilyPond note names, keeping the written accidental
+LILYPOND_NOTE_MAP = {
+    'c#': 'cis',  'd#': 'dis',  'f#': 'fis',  'g#': 'gis',  'a#': 'ais',
+    'cb': 'ces',  'db': 'des',  'eb': 'ees',  'fb': 'fes',  'gb': 'ges',
+    'ab': 'aes',  'bb': 'bes',  'e#': 'eis',  'b#': 'bis'  # E# and B# for completeness
+}
+
+# LilyPond note names, respelling flats as sharps
+LILYPOND_NOTE_MAP_SHARP = {
+    'c#': 'cis',  'd#': 'dis',  'f#': 'fis',  'g#': 'gis',
+    'a#': 'ais',  'cb': 'b',    'db': 'cis',  'eb': 'dis',
+    'fb': 'e',    'gb': 'fis',  'ab': 'gis',  'bb': 'ais',
+    'e#': 'eis',  'b#': 'bis'
+}
+
+# Relative minor for every major key
+RELATIVE_MINORS = {
+    'c': 'a', 'g': 'e', 'd': 'b', 'a': 'f#', 'e': 'c#', 'b': 'g#', 'f#': 'd#', 'c#': 'a#',
+    'f': 'd', 'bb': 'g', 'eb': 'c', 'ab': 'f', 'db': 'bb', 'gb': 'eb', 'cb': 'ab'
+}
+
+# Every key a scale can start on: the major keys plus their relative minors
+ALL_KEYS = list(dict.fromkeys(list(RELATIVE_MINORS) + list(RELATIVE_MINORS.values())))
+
+# Patterns compiled once at import
+LILYPOND_VERSION_RE = re.compile(r'LilyPond\s+(\d+\.\d+\.\d+)')
+
+# Absolute path of the lilypond executable, resolved once (None if missing)
+LILYPOND_BIN = shutil.which('lilypond')
+
+# Where the detected LilyPond version is remembered between runs
+LILYPOND_VERSION_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'scalegen', 'lilypond_version')
+
+# Where compiled PDF/MIDI files are kept, keyed by a hash of the .ly source
+LILYPOND_BUILD_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'scalegen', 'builds')
+
+# Lists the outputs of a complete build cache entry; written last
+BUILD_MANIFEST = 'manifest.json'
+
+# Note order + index table for each spelling, looked up by name
+NOTE_ORDERS = {
+    "sharp": (NOTE_ORDER_SHARP, NOTE_INDEX_SHARP),
+    "flat": (NOTE_ORDER_FLAT, NOTE_INDEX_FLAT)
+}
+
+############################################################################
+# 1. Utility: Convert accidentals to LilyPond format (for notes AND keys)  #
+############################################################################
+def convert_to_lilypond_note(note):
+    """
+    Converts a standard note with accidentals to LilyPond-compatible notation.
 
     Args:
-        key (str): The root note of the scale (e.g., 'c', 'g#', 'eb').
-        octaves (int): The number of octaves to generate (1 to 4).
+        note (str): The note to convert (e.g., 'f#', 'eb').
 
-    Raises:
-        SystemExit: If any errors occur during file operations or compilation.
+    Returns:
+        str: The LilyPond-compatible note name (e.g., 'fis', 'ees').
     """
+    note_lower = note.lower()
+    return LILYPOND_NOTE_MAP.get(note_lower, note_lower)
 
-    # Define the scale intervals for different scale types
-    SCALE_INTERVALS = {
-        "major": [2, 2, 1, 2, 2, 2, 1],
-        "minor": [2, 1, 2, 2, 1, 2, 2]  # Natural Minor Scale
-    }
+def convert_to_lilypond_note_sharp(note):
+    """
+    Converts a standard note with accidentals to LilyPond-compatible notation,
+    favoring sharps for accidentals.
 
-    # Define note orders for sharp and flat contexts
-    NOTE_ORDER_SHARP = ['c', 'c#', 'd', 'd#', 'e', 'f', 'f#', 'g', 'g#', 'a', 'a#', 'b']
-    NOTE_ORDER_FLAT = ['c', 'db', 'd', 'eb', 'e', 'f', 'gb', 'g', 'ab', 'a', 'bb', 'b']
-
-    # Define flat keys for reference
-    FLAT_KEYS = ['f', 'bb', 'eb', 'ab', 'db', 'gb', 'cb']
-
-    # Scale types to generate
-    SCALE_TYPES = ["major", "minor"]
-
-    ############################################################################
-    # 1. Utility: Convert accidentals to LilyPond format (for notes AND keys)  #
-    ############################################################################
-    def convert_to_lilypond_note(note):
-        """
-        Converts a standard note with accidentals to LilyPond-compatible notation.
-
-        Args:
-            note (str): The note to convert (e.g., 'f#', 'eb').
-
-        Returns:
-            str: The LilyPond-compatible note name (e.g., 'fis', 'ees').
-        """
-        mapping = {
-            'c#': 'cis',  'd#': 'dis',  'f#': 'fis',  'g#': 'gis',  'a#': 'ais',
-            'cb': 'ces',  'db': 'des',  'eb': 'ees',  'fb': 'fes',  'gb': 'ges',
-            'ab': 'aes',  'bb': 'bes',  'e#': 'eis',  'b#': 'bis'  # E# and B# for completeness
-        }
-        note_lower = note.lower()
-        return mapping.get(note_lower, note_lower)
-
-    def convert_to_lilypond_note_sharp(note):
-        """
-        Converts a standard note with accidentals to LilyPond-compatible notation,
-        favoring sharps for accidentals.
-
-        Args:
-            note (str): The note to convert (e.g., 'f#', 'eb').
-
-        Returns:
-            str: The LilyPond-compatible note name with sharps (e.g., 'fis', 'dis').
-        """
-        sharp_mapping = {
-            'c#': 'cis',  'd#': 'dis',  'f#': 'fis',  'g#': 'gis',
-            'a#': 'ais',  'cb': 'b',    'db': 'cis',  'eb': 'dis',
-            'fb': 'e',    'gb': 'fis',  'ab': 'gis',  'bb': 'ais',
-            'e#': 'eis',  'b#': 'bis'
-        }
-        note_lower = note.lower()
-        return sharp_mapping.get(note_lower, convert_to_lilypond_note(note_lower))
-
-    def convert_to_lilypond_relative(note):
-        """
-        Converts the first note of a key (e.g., 'f#') into LilyPond-compatible
-        relative pitch (e.g., 'fis' + "'").
-
-        Args:
-            note (str): The key, e.g. 'f#'
-
-        Returns:
-            str: Something like "fis'" or "ees'"
-        """
-        match = re.match(r'^([a-gA-G][b#]?)', note)
-        if match:
-            base_note = match.group(1).lower()
-            base_note_lily = convert_to_lilypond_note(base_note)
-            return base_note_lily + "'"
+    Args:
+        note (str): The note to convert (e.g., 'f#', 'eb').
+
+    Returns:
+        str: The LilyPond-compatible note name with sharps (e.g., 'fis', 'dis').
+    """
+    note_lower = note.lower()
+    return LILYPOND_NOTE_MAP_SHARP.get(note_lower, convert_to_lilypond_note(note_lower))
+
+def convert_to_lilypond_relative(note):
+    """
+    Converts the first note of a key (e.g., 'f#') into LilyPond-compatible
+    relative pitch (e.g., 'fis' + "'").
+
+    Args:
+        note (str): The key, e.g. 'f#'
+
+    Returns:
+        str: Something like "fis'" or "ees'"
+    """
+    if not note or note[0].lower() not in 'abcdefg':
         return "c'"
+    # Letter plus an optional accidental; no regex needed for two characters
+    base_note = note[:2] if len(note) > 1 and note[1] in 'b#' else note[:1]
+    return convert_to_lilypond_note(base_note.lower()) + "'"
+
+# Quarter-note tokens ("fis4", ...) for every note either note order can
+# produce; ascending notes keep their spelling, descending ones use sharps
+QUARTER_NOTE_TOKENS = {
+    n: convert_to_lilypond_note(n) + '4' for n in NOTE_ORDER_SHARP + NOTE_ORDER_FLAT
+}
+QUARTER_NOTE_TOKENS_SHARP = {
+    n: convert_to_lilypond_note_sharp(n) + '4' for n in NOTE_ORDER_SHARP + NOTE_ORDER_FLAT
+}
+
+############################################################################
+# 2. Creating the scale notes (ascending + descending)                     #
+############################################################################
+def get_note_index(note, note_index):
+    """
+    Retrieves the index of the note from a precomputed note_index table.
+    Enharmonic equivalents (db -> c#, etc.) are already folded in.
 
-    ############################################################################
-    # 2. Creating the scale notes (ascending + descending)                     #
-    ############################################################################
-    def get_note_index(note, note_order):
-        """
-        Retrieves the index of the note in the provided note_order list.
-        Handles enharmonic equivalents as well (db -> c#, etc.).
-
-        Args:
-            note (str): The note to find (e.g., 'c', 'd#', 'eb').
-            note_order (list): The list of notes to search within.
-
-        Returns:
-            int: The index of the note in the note_order list.
-        """
-        enharmonic = {
-            'cb': 'b', 'fb': 'e', 'db': 'c#', 'eb': 'd#', 'gb': 'f#', 'ab': 'g#', 'bb': 'a#',
-            'e#': 'f', 'b#': 'c'
-        }
-        n_lower = note.lower()
-        if n_lower in note_order:
-            return note_order.index(n_lower)
-        elif n_lower in enharmonic and enharmonic[n_lower] in note_order:
-            return note_order.index(enharmonic[n_lower])
-        return note_order.index('c')
-
-    def next_note(current_note, interval, note_order):
-        """
-        Calculates the next note in the scale based on the interval.
-
-        Args:
-            current_note (str): The current note.
-            interval (int): Steps to move in the note_order (e.g., 2 or 1).
-            note_order (list): The list of notes to use (sharps or flats).
-
-        Returns:
-            str: The next note in the scale.
-        """
-        index = get_note_index(current_note, note_order)
-        next_index = (index + interval) % len(note_order)
-        return note_order[next_index]
-
-    def generate_scale_notes(key, scale_type, octaves, note_order):
-        """
-        Generates ascending + descending scale notes in LilyPond format.
-
-        Args:
-            key (str): The key (e.g., 'c', 'g#', 'eb').
-            scale_type (str): 'major' or 'minor'.
-            octaves (int): 1-4.
-            note_order (list): Sharps or flats version of the chromatic scale.
-
-        Returns:
-            str: LilyPond-formatted scale notes with quarter durations.
-        """
-        if scale_type not in SCALE_INTERVALS:
-            print(f"Error: Scale type '{scale_type}' not supported.")
-            sys.exit(1)
+    Args:
+        note (str): The note to find (e.g., 'c', 'd#', 'eb').
+        note_index (dict): NOTE_INDEX_SHARP or NOTE_INDEX_FLAT.
 
-        intervals = SCALE_INTERVALS[scale_type]
-        current_note = key.lower()
-        scale = [current_note]
-
-        for interval in intervals:
-            current_note = next_note(current_note, interval, note_order)
-            scale.append(current_note)
-
-        full_scale = scale.copy()
-        for _ in range(1, octaves):
-            starting_note = scale[-1]
-            for interval in intervals:
-                starting_note = next_note(starting_note, interval, note_order)
-                full_scale.append(starting_note)
-
-        descending_scale = full_scale[::-1][1:]
-
-        lilypond_notes_asc = [convert_to_lilypond_note(n) for n in full_scale]
-        lilypond_notes_desc = [convert_to_lilypond_note_sharp(n) for n in descending_scale]
-
-        combined_scale = lilypond_notes_asc + lilypond_notes_desc
-        notes_with_rhythm = ' '.join(f"{n}4" for n in combined_scale)
-        return notes_with_rhythm
-
-    ############################################################################
-    # 3. Determine note order (sharp/flat), relative minors, etc.             #
-    ############################################################################
-    def determine_note_order(k):
-        """
-        Chooses sharps vs flats based on the key name.
-        """
-        k_lower = k.lower()
-        if k_lower in FLAT_KEYS or 'b' in k_lower:
-            return NOTE_ORDER_FLAT
-        else:
-            return NOTE_ORDER_SHARP
-
-    def find_relative_minor(major_key):
-        """
-        Returns the relative minor for a given major key.
-        """
-        relative_minors = {
-            'c': 'a', 'g': 'e', 'd': 'b', 'a': 'f#', 'e': 'c#', 'b': 'g#', 'f#': 'd#', 'c#': 'a#',
-            'f': 'd', 'bb': 'g', 'eb': 'c', 'ab': 'f', 'db': 'bb', 'gb': 'eb', 'cb': 'ab'
-        }
-        mk_lower = major_key.lower()
-        return relative_minors.get(mk_lower, 'a')
-
-    ############################################################################
-    # 4. File cleanup, LilyPond version retrieval, compile steps              #
-    ############################################################################
-    def delete_existing_files(filenames):
-        """
-        Deletes existing files if they exist.
-        """
-        for filename in filenames:
-            if os.path.exists(filename):
-                try:
-                    os.remove(filename)
-                    print(f"Deleted existing file: {filename}")
-                except Exception as e:
-                    print(f"Error deleting file '{filename}': {e}")
-                    sys.exit(1)
-
-    def get_lilypond_version():
-        """
-        Checks the installed LilyPond version, or exits if not found.
-        """
-        try:
-            result = subprocess.run(['lilypond', '--version'], capture_output=True, text=True, check=True)
-            match = re.search(r'LilyPond\s+(\d+\.\d+\.\d+)', result.stdout)
-            if match:
-                return match.group(1)
-            else:
-                print("Error: Could not parse LilyPond version.")
-                sys.exit(1)
-        except subprocess.CalledProcessError as e:
-            print(f"Error retrieving LilyPond version: {e}")
-            sys.exit(1)
-        except FileNotFoundError:
-            print("Error: LilyPond not found in PATH.")
-            sys.exit(1)
+    Returns:
+        int: The index of the note, or 0 ('c') if it is unknown.
+    """
+    return note_index.get(note.lower(), 0)
+
+def build_scale_offsets(intervals):
+    """
+    Computes the cumulative chromatic offset of every degree in one octave
+    of the scale, from the root (0) up to the octave (12).
+
+    Args:
+        intervals (list): Steps between consecutive scale degrees.
+
+    Returns:
+        list: Offsets from the root, one per ascending note.
+    """
+    return list(itertools.accumulate(intervals, initial=0))
+
+# Cumulative one-octave offsets for each scale type
+SCALE_OFFSETS = {st: build_scale_offsets(intervals) for st, intervals in SCALE_INTERVALS.items()}
+
+@functools.lru_cache(maxsize=256)
+def build_scale_notes(key, scale_type, octaves, note_order_name):
+    """
+    Builds ascending + descending scale notes in LilyPond format from the
+    precomputed SCALE_OFFSETS. Recent results for keys outside SCALE_CACHE
+    are memoized.
+
+    Args:
+        key (str): The key (e.g., 'c', 'g#', 'eb').
+        scale_type (str): 'major' or 'minor'.
+        octaves (int): 1-4.
+        note_order_name (str): 'sharp' or 'flat' (see NOTE_ORDERS).
+
+    Returns:
+        str: LilyPond-formatted scale notes with quarter durations.
+    """
+    if scale_type not in SCALE_INTERVALS:
+        print(f"Error: Scale type '{scale_type}' not supported.")
+        sys.exit(1)
 
-    ############################################################################
-    # 5. Build the actual .ly content and run the compilation                 #
-    ############################################################################
-    def generate_lilypond_combined(filename, main_key, scale_types, octaves, lilypond_version):
-        """
-        Generates a LilyPond .ly file with the desired scales, then compiles it.
-        """
-        global_header = f"""
-\\version "{lilypond_version}"  % Force LilyPond to treat code with this version
-
-\\header {{
+    note_order, note_index = NOTE_ORDERS[note_order_name]
+    root = get_note_index(key, note_index)
+
+    # The intervals span exactly 12 semitones, so every octave repeats the
+    # same pitch classes: build one octave above the root and repeat it.
+    octave = [note_order[(root + step) % 12] for step in SCALE_OFFSETS[scale_type][1:]]
+
+    # Notes map straight to their "<lilypond-name>4" tokens. Only the key
+    # itself (first and last note) keeps its own spelling, which may not be
+    # in the token tables, so it is converted directly.
+    up = [QUARTER_NOTE_TOKENS[n] for n in octave]
+    down = [QUARTER_NOTE_TOKENS_SHARP[n] for n in reversed(octave)]
+
+    # Chain the pieces instead of concatenating lists: the descending half
+    # skips the top note, which the ascending half already ends on.
+    notes_with_rhythm = ' '.join(itertools.chain(
+        [convert_to_lilypond_note(key) + '4'],
+        up * octaves,
+        down[1:],
+        down * (octaves - 1),
+        [convert_to_lilypond_note_sharp(key) + '4'],
+    ))
+    return notes_with_rhythm
+
+############################################################################
+# 3. Determine note order (sharp/flat), relative minors, etc.             #
+############################################################################
+def determine_note_order(k):
+    """
+    Chooses sharps vs flats based on the key name.
+
+    Returns:
+        str: 'flat' or 'sharp', a key into NOTE_ORDERS.
+    """
+    k_lower = k.lower()
+    if k_lower in FLAT_KEY_SET or 'b' in k_lower:
+        return "flat"
+    else:
+        return "sharp"
+
+def find_relative_minor(major_key):
+    """
+    Returns the relative minor for a given major key.
+    """
+    mk_lower = major_key.lower()
+    return RELATIVE_MINORS.get(mk_lower, 'a')
+
+def resolve_scale_key(main_key, scale_type):
+    """
+    Works out which key a scale starts on and how it is written.
+
+    Args:
+        main_key (str): The key requested by the user (e.g., 'eb').
+        scale_type (str): 'major' or 'minor' (minor uses the relative minor).
+
+    Returns:
+        tuple: (scale_key, note_order_name, relative_pitch).
+    """
+    if scale_type == "minor":
+        scale_key = find_relative_minor(main_key)
+    else:
+        scale_key = main_key.lower()
+    return scale_key, determine_note_order(scale_key), convert_to_lilypond_relative(scale_key)
+
+# (main_key, scale_type) -> (scale_key, note_order_name, relative_pitch)
+KEY_TABLE = {(k, st): resolve_scale_key(k, st) for k in ALL_KEYS for st in SCALE_TYPES}
+
+def get_key_entry(main_key, scale_type):
+    """
+    Returns the KEY_TABLE entry for a key, resolving keys outside the table.
+    """
+    entry = KEY_TABLE.get((main_key.lower(), scale_type))
+    if entry is None:
+        entry = resolve_scale_key(main_key, scale_type)
+    return entry
+
+############################################################################
+# Precomputed scales for every supported key                               #
+############################################################################
+def build_scale_cache():
+    """
+    Builds every scale for ALL_KEYS x SCALE_TYPES x 1-4 octaves up front.
+    Goes through the unmemoized builder so these strings are not also held
+    by build_scale_notes' LRU cache.
+
+    Returns:
+        dict: (key, scale_type, octaves, note_order_name) -> scale notes string.
+    """
+    build = build_scale_notes.__wrapped__
+    cache = {}
+    for k in ALL_KEYS:
+        note_order_name = determine_note_order(k)
+        for st in SCALE_TYPES:
+            for octaves in range(1, 5):
+                cache[(k, st, octaves, note_order_name)] = build(k, st, octaves, note_order_name)
+    return cache
+
+SCALE_CACHE = build_scale_cache()
+
+def generate_scale_notes(key, scale_type, octaves, note_order_name):
+    """
+    Returns ascending + descending scale notes in LilyPond format, served
+    from SCALE_CACHE when possible.
+
+    Args:
+        key (str): The key (e.g., 'c', 'g#', 'eb').
+        scale_type (str): 'major' or 'minor'.
+        octaves (int): 1-4.
+        note_order_name (str): 'sharp' or 'flat' (see NOTE_ORDERS).
+
+    Returns:
+        str: LilyPond-formatted scale notes with quarter durations.
+    """
+    cached = SCALE_CACHE.get((key.lower(), scale_type, octaves, note_order_name))
+    if cached is not None:
+        return cached
+    return build_scale_notes(key, scale_type, octaves, note_order_name)
+
+############################################################################
+# LilyPond source templates, parsed once at import                         #
+############################################################################
+LILYPOND_HEADER_TEMPLATE = string.Template("""
+\\version "${version}"  % Force LilyPond to treat code with this version
+
+\\header {
     title = "Practice Scales"
     composer = "Traditional"
-}}
+}
 
-\\paper {{
+\\paper {
     top-margin = 1.5\\cm
     bottom-margin = 1.5\\cm
     left-margin = 2\\cm
@@ -256,88 +345,502 @@ def generate_and_compile_scales(key, octaves):
     indent = 0
     system-count = #0
     line-width = 16\\cm  % Adjust as needed
-}}
-"""
-
-        lilypond_content = global_header + "\n"
-
-        for st in scale_types:
-            if st == "minor":
-                rel_minor_key = find_relative_minor(main_key)
-                scale_key = rel_minor_key
-                mode = "minor"
-            else:
-                scale_key = main_key.lower()
-                mode = "major"
-
-            this_note_order = determine_note_order(scale_key)
-            scale_notes = generate_scale_notes(scale_key, st, octaves, this_note_order)
-            relative_pitch = convert_to_lilypond_relative(scale_key)
-            scale_label = f"{scale_key.capitalize()} {st.capitalize()} Scale"
-
-            scale_score = f"""
-\\markup \\column {{
-  \\center-column {{
-    \\bold "{scale_label}"
-  }}
-}}
-
-\\score {{
-  \\new Staff {{
+}
+""")
+
+SCALE_SCORE_TEMPLATE = string.Template("""
+\\markup \\column {
+  \\center-column {
+    \\bold "${scale_label}"
+  }
+}
+
+\\score {
+  \\new Staff {
     % Force all accidentals to show (for any sharp or flat).
     \\override Accidental #'force-accidental = ##t
 
     \\override Staff.TimeSignature #'transparent = ##t
 
-    \\relative {relative_pitch} {{
-      {scale_notes}
-    }}
-  }}
-  \\layout {{
+    \\relative ${relative_pitch} {
+      ${scale_notes}
+    }
+  }
+${output_blocks}}
+""")
+
+# Output blocks of a \score: \layout typesets it for the PDF, \midi
+# renders the MIDI file. Without \layout the staves are not typeset, but
+# the title and \markup labels still are; MIDI-only runs therefore also
+# switch LilyPond to its null backend (see run_lilypond).
+SCORE_LAYOUT_BLOCK = """  \\layout {
     indent = 0
     ragged-right = ##t
-  }}
-  \\midi {{ }}
-}}
+  }
 """
-            lilypond_content += scale_score + "\n"
 
-        try:
-            with open(filename, 'w') as f:
-                f.write(lilypond_content)
-            print(f"LilyPond file '{filename}' generated successfully.")
-        except IOError as e:
-            print(f"Error writing to '{filename}': {e}")
+SCORE_MIDI_BLOCK = """  \\midi { }
+"""
+
+############################################################################
+# LilyPond version lookup (cached per process and on disk)                 #
+############################################################################
+def read_cached_lilypond_version(binary):
+    """
+    Reads the LilyPond version remembered from a previous run, if it was
+    recorded for this exact binary (same path and modification time).
+
+    Args:
+        binary (str): Absolute path of the lilypond executable.
+
+    Returns:
+        str or None: The cached version, or None on a cache miss.
+    """
+    try:
+        mtime = os.stat(binary).st_mtime
+        with open(LILYPOND_VERSION_CACHE) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Anything other than the object written below is treated as a miss.
+    if not isinstance(cached, dict):
+        return None
+    version = cached.get('version')
+    if cached.get('path') == binary and cached.get('mtime') == mtime and isinstance(version, str):
+        return version
+    return None
+
+def write_cached_lilypond_version(binary, version):
+    """
+    Remembers the LilyPond version for this binary. Failures are ignored,
+    since the cache is only an optimization.
+    """
+    try:
+        os.makedirs(os.path.dirname(LILYPOND_VERSION_CACHE), exist_ok=True)
+        with open(LILYPOND_VERSION_CACHE, 'w') as f:
+            json.dump({'path': binary, 'mtime': os.stat(binary).st_mtime, 'version': version}, f)
+    except OSError:
+        pass
+
+@functools.lru_cache(maxsize=1)
+def get_lilypond_version():
+    """
+    Checks the installed LilyPond version, or exits if not found.
+    Only runs `lilypond --version` when the on-disk cache is stale.
+    """
+    binary = LILYPOND_BIN
+    if binary is None:
+        print("Error: LilyPond not found in PATH.")
+        sys.exit(1)
+
+    cached_version = read_cached_lilypond_version(binary)
+    if cached_version:
+        return cached_version
+
+    try:
+        result = subprocess.run([binary, '--version'], capture_output=True, text=True, check=True)
+        match = LILYPOND_VERSION_RE.search(result.stdout)
+        if match:
+            version = match.group(1)
+        else:
+            print("Error: Could not parse LilyPond version.")
             sys.exit(1)
+    except subprocess.CalledProcessError as e:
+        print(f"Error retrieving LilyPond version: {e}")
+        sys.exit(1)
+    except FileNotFoundError:
+        print("Error: LilyPond not found in PATH.")
+        sys.exit(1)
 
+    write_cached_lilypond_version(binary, version)
+    return version
+
+############################################################################
+# 4. File cleanup and LilyPond compilation                                 #
+############################################################################
+def delete_existing_files(filenames):
+    """
+    Deletes existing files if they exist. Tries the removal directly
+    instead of checking first, so each file costs a single syscall.
+    """
+    for filename in filenames:
         try:
-            print(f"Compiling the LilyPond file '{filename}'...")
-            subprocess.run(['lilypond', filename], check=True)
-            base = os.path.splitext(filename)[0]
-            print(f"Compilation successful! Created '{base}.pdf' and '{base}.midi'.\n")
-        except subprocess.CalledProcessError as e:
-            print(f"Error while compiling '{filename}': {e}")
-            sys.exit(1)
+            os.remove(filename)
         except FileNotFoundError:
-            print("Error: LilyPond is not installed or not in PATH.")
+            continue
+        except OSError as e:
+            print(f"Error deleting file '{filename}': {e}")
             sys.exit(1)
+        print(f"Deleted existing file: {filename}")
 
-    # ------------------------------- MAIN LOGIC -------------------------------
+def get_output_filenames(ly_filename):
+    """
+    Lists a .ly file together with the PDF and MIDI files currently next to
+    it. Each \\score gets its own MIDI file ('<base>.midi', '<base>-1.midi',
+    ...), and the number of scores can change between runs, so the files
+    are looked up rather than derived from the current score count.
 
+    Args:
+        ly_filename (str): The .ly file.
+
+    Returns:
+        list: The .ly filename followed by any existing PDF/MIDI filenames.
+    """
+    base = os.path.splitext(ly_filename)[0]
+    try:
+        suffixes = find_lilypond_outputs(ly_filename)
+    except OSError:
+        suffixes = []
+    return [ly_filename] + [base + suffix for suffix in suffixes]
+
+def get_lilypond_options(emit_pdf=True):
+    """
+    Returns the LilyPond command-line options for a build. With emit_pdf
+    off, the null backend keeps the titles and labels that are still
+    typeset from being written out as a PDF.
+
+    These options shape the output, so they are part of the build cache
+    key as well (see get_build_digest).
+    """
+    # Only errors are reported and progress output is discarded, so the
+    # terminal does not throttle LilyPond; point-and-click links are
+    # not needed in practice sheets. MIDI comes out of the same pass from
+    # each score's \midi block.
+    options = ['--loglevel=ERROR', '-dno-point-and-click']
+    if not emit_pdf:
+        options.append('-dbackend=null')
+    return options
+
+def run_lilypond(filenames, output_dir, emit_pdf=True):
+    """
+    Compiles one or more .ly files in a single LilyPond process, writing
+    each file's PDF/MIDI into output_dir under the file's own name.
+    Expects LILYPOND_BIN to be set; compile_lilypond checks this first.
+    """
+    # With an absolute binary path and close_fds=False, CPython launches
+    # the process via posix_spawn instead of fork+exec; Python's own
+    # descriptors are non-inheritable by default, so nothing leaks.
+    command = [LILYPOND_BIN] + get_lilypond_options(emit_pdf) + ['-o', output_dir]
+    subprocess.run(
+        command + list(filenames),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+        close_fds=False
+    )
+
+def get_build_digest(filename, emit_pdf=True):
+    """
+    Hashes a .ly file's bytes together with the LilyPond options used to
+    build it, so e.g. a MIDI-only build is never served for a full one.
+    The source embeds the \\version line, so a LilyPond upgrade produces a
+    different digest.
+
+    Returns:
+        str or None: The hex digest, or None if the file cannot be read.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update('\0'.join(get_lilypond_options(emit_pdf)).encode('utf-8') + b'\0')
+    try:
+        with open(filename, 'rb') as f:
+            digest.update(f.read())
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def find_lilypond_outputs(filename):
+    """
+    Lists the output suffixes LilyPond produced for a .ly file, e.g.
+    '.pdf', '.midi' and '-1.midi' for a second score's MIDI.
+    """
+    directory = os.path.dirname(filename) or '.'
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    pattern = re.compile(re.escape(stem) + r'((?:-\d+)?\.midi|\.pdf)$')
+    return [m.group(1) for m in map(pattern.match, os.listdir(directory)) if m]
+
+def restore_cached_build(filename, digest):
+    """
+    Copies a previous build of identical source next to the .ly file. Only
+    entries with a manifest, which store_cached_build writes last, count as
+    complete; anything else is a miss.
+
+    Returns:
+        bool: True if the cached PDF/MIDI files were restored.
+    """
+    if digest is None:
+        return False
+    cache_dir = os.path.join(LILYPOND_BUILD_CACHE, digest)
+    try:
+        with open(os.path.join(cache_dir, BUILD_MANIFEST)) as f:
+            suffixes = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if not isinstance(suffixes, list) or not suffixes:
+        return False
+    base = os.path.splitext(filename)[0]
+    try:
+        for suffix in suffixes:
+            shutil.copyfile(os.path.join(cache_dir, suffix), base + suffix)
+    except OSError:
+        return False
+    return True
+
+def store_cached_build(filename, digest, build_dir):
+    """
+    Copies the PDF/MIDI files a fresh build of filename wrote into build_dir
+    to the build cache. build_dir holds only this run's output, so stale
+    files next to the source are never cached. The entry is assembled in a
+    temporary directory, finished with its manifest and renamed into place,
+    so an interrupted or concurrent write never leaves a partial entry.
+    Failing to write the cache only costs a recompile next time, so errors
+    are ignored.
+    """
+    if digest is None:
+        return
+    cache_dir = os.path.join(LILYPOND_BUILD_CACHE, digest)
+    built = os.path.join(build_dir, os.path.basename(filename))
+    base = os.path.splitext(built)[0]
+    staging_dir = None
+    try:
+        suffixes = find_lilypond_outputs(built)
+        if not suffixes:
+            return
+        os.makedirs(LILYPOND_BUILD_CACHE, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(dir=LILYPOND_BUILD_CACHE, prefix='.tmp-')
+        for suffix in suffixes:
+            shutil.copyfile(base + suffix, os.path.join(staging_dir, suffix))
+        with open(os.path.join(staging_dir, BUILD_MANIFEST), 'w') as f:
+            json.dump(suffixes, f)
+        # Only finished entries are ever renamed in, so a directory without
+        # a manifest is a leftover that would block the rename.
+        if os.path.isdir(cache_dir) and not os.path.exists(os.path.join(cache_dir, BUILD_MANIFEST)):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        os.rename(staging_dir, cache_dir)
+        staging_dir = None
+    except OSError:
+        pass
+    finally:
+        if staging_dir is not None:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+def compile_lilypond(filenames, use_tmpfs=False, use_cache=True, emit_pdf=True):
+    """
+    Compiles .ly files that live in the same directory with one LilyPond
+    run, so its startup cost is paid once for the whole batch. LilyPond
+    writes into a scratch directory and the finished PDF and MIDI files are
+    then moved next to the sources. Files whose exact source was compiled
+    before are copied from the build cache instead.
+
+    The cache lives in LILYPOND_BUILD_CACHE (~/.cache/scalegen/builds),
+    one directory per distinct .ly source. Nothing is ever evicted, so it
+    grows with every new key/octave/output combination; delete the
+    directory to reclaim the space, or pass use_cache=False.
+
+    Args:
+        filenames (list): The .ly files to compile.
+        use_tmpfs (bool): Put the scratch directory on RAM-backed storage
+            (/dev/shm when available) instead of next to the sources.
+        use_cache (bool): Reuse and record builds in LILYPOND_BUILD_CACHE.
+        emit_pdf (bool): Write a PDF; off, LilyPond only renders MIDI.
+
+    Raises:
+        SystemExit: If LilyPond is missing or compilation fails.
+    """
+    if LILYPOND_BIN is None:
+        print("Error: LilyPond is not installed or not in PATH.")
+        sys.exit(1)
+
+    filenames = list(filenames)
+    out_dir = os.path.dirname(filenames[0]) or '.'
+    names = "', '".join(filenames)
+    try:
+        if use_cache:
+            digests = {filename: get_build_digest(filename, emit_pdf) for filename in filenames}
+            pending = [f for f in filenames if not restore_cached_build(f, digests[f])]
+        else:
+            pending = filenames
+        for filename in filenames:
+            if filename not in pending:
+                print(f"Restored the output of '{filename}' from the build cache.")
+        if pending:
+            pending_names = "', '".join(pending)
+            print(f"Compiling the LilyPond file '{pending_names}'...")
+            # Next to the sources the final moves are plain renames.
+            tmp_root = '/dev/shm' if use_tmpfs and os.path.isdir('/dev/shm') else out_dir
+            with tempfile.TemporaryDirectory(dir=tmp_root) as work_dir:
+                run_lilypond(pending, work_dir, emit_pdf)
+                if use_cache:
+                    for filename in pending:
+                        store_cached_build(filename, digests[filename], work_dir)
+                for name in os.listdir(work_dir):
+                    shutil.move(os.path.join(work_dir, name), os.path.join(out_dir, name))
+        for filename in filenames:
+            base = os.path.splitext(filename)[0]
+            created = "' and '".join(f for f in (f"{base}.pdf", f"{base}.midi") if os.path.exists(f))
+            print(f"Compilation successful! Created '{created}'.\n")
+    except subprocess.CalledProcessError as e:
+        print(f"Error while compiling '{names}': {e}")
+        if e.stderr:
+            print(e.stderr.strip())
+        sys.exit(1)
+    except FileNotFoundError:
+        print("Error: LilyPond is not installed or not in PATH.")
+        sys.exit(1)
+    except OSError as e:
+        print(f"Error moving LilyPond output for '{names}': {e}")
+        sys.exit(1)
+
+############################################################################
+# 5. Build the actual .ly content and run the compilation                 #
+############################################################################
+def write_lilypond_combined(filename, main_keys, scale_types, octaves, lilypond_version,
+                            emit_pdf=True, emit_midi=True):
+    """
+    Writes a LilyPond .ly file with the desired scales for every key.
+    Leaving out the PDF drops each score's \\layout block, so its staves
+    are not typeset; leaving out the MIDI drops its \\midi block.
+    """
+    global_header = LILYPOND_HEADER_TEMPLATE.substitute(version=lilypond_version)
+    output_blocks = (SCORE_LAYOUT_BLOCK if emit_pdf else "") + (SCORE_MIDI_BLOCK if emit_midi else "")
+
+    parts = [global_header, "\n"]
+
+    for main_key in main_keys:
+        for st in scale_types:
+            scale_key, note_order_name, relative_pitch = get_key_entry(main_key, st)
+            scale_notes = generate_scale_notes(scale_key, st, octaves, note_order_name)
+            scale_label = f"{scale_key.capitalize()} {st.capitalize()} Scale"
+
+            scale_score = SCALE_SCORE_TEMPLATE.substitute(
+                scale_label=scale_label, relative_pitch=relative_pitch, scale_notes=scale_notes,
+                output_blocks=output_blocks
+            )
+            parts.append(scale_score)
+            parts.append("\n")
+
+    lilypond_content = "".join(parts).encode('utf-8')
+
+    try:
+        # Write pre-encoded bytes so the text layer (encoding + newline
+        # translation) is skipped; the file goes out in a single write.
+        with open(filename, 'wb') as f:
+            f.write(lilypond_content)
+        print(f"LilyPond file '{filename}' generated successfully.")
+    except IOError as e:
+        print(f"Error writing to '{filename}': {e}")
+        sys.exit(1)
+
+def generate_lilypond_combined(filename, main_keys, scale_types, octaves, lilypond_version,
+                               use_tmpfs=False, emit_pdf=True, emit_midi=True, use_cache=True):
+    """
+    Generates a LilyPond .ly file with the desired scales for every key,
+    then compiles it with a single LilyPond run.
+    """
+    write_lilypond_combined(filename, main_keys, scale_types, octaves, lilypond_version,
+                            emit_pdf, emit_midi)
+    compile_lilypond([filename], use_tmpfs, use_cache, emit_pdf)
+
+def validate_octaves(octaves):
+    """
+    Exits unless octaves is an integer between 1 and 4.
+    """
     if not isinstance(octaves, int) or not (1 <= octaves <= 4):
         print("Error: Number of octaves must be an integer between 1 and 4.")
         sys.exit(1)
 
-    ly_filename = "combined_practice.ly"
-    pdf_filename = "combined_practice.pdf"
-    midi_filename = "combined_practice.midi"
+def validate_outputs(emit_pdf, emit_midi):
+    """
+    Exits unless at least one of the PDF and MIDI outputs is requested.
+    """
+    if not (emit_pdf or emit_midi):
+        print("Error: At least one of PDF and MIDI output must be enabled.")
+        sys.exit(1)
+
+# ------------------------------- MAIN LOGIC -------------------------------
+
+def generate_and_compile_scales(key, octaves, ly_filename="combined_practice.ly", use_tmpfs=False,
+                                emit_pdf=True, emit_midi=True, use_cache=True):
+    """
+    Generates multiple scales in LilyPond format based on the specified key and number of octaves.
+    Compiles the LilyPond file into PDF and MIDI formats.
+
+    Passing a list of keys puts every key's scales into the same file, so
+    LilyPond starts only once for the whole set.
+
+    Args:
+        key (str or list): The root note of the scale (e.g., 'c', 'g#', 'eb'),
+            or a list of root notes.
+        octaves (int): The number of octaves to generate (1 to 4).
+        ly_filename (str): The .ly file to write; the PDF and MIDI share its name.
+        use_tmpfs (bool): Compile in a RAM-backed temporary directory and move
+            the finished PDF/MIDI into place.
+        emit_pdf (bool): Typeset the scales into a PDF.
+        emit_midi (bool): Render the scales into MIDI.
+        use_cache (bool): Copy a previous identical build from
+            LILYPOND_BUILD_CACHE instead of running LilyPond, and record
+            new builds there.
+
+    Raises:
+        SystemExit: If any errors occur during file operations or compilation.
+    """
+    validate_octaves(octaves)
+    validate_outputs(emit_pdf, emit_midi)
 
-    delete_existing_files([ly_filename, pdf_filename, midi_filename])
+    keys = [key] if isinstance(key, str) else list(key)
+    delete_existing_files(get_output_filenames(ly_filename))
     lilypond_version = get_lilypond_version()
     print("Generating scales in LilyPond...")
-    generate_lilypond_combined(ly_filename, key, SCALE_TYPES, octaves, lilypond_version)
+    generate_lilypond_combined(ly_filename, keys, SCALE_TYPES, octaves, lilypond_version, use_tmpfs,
+                               emit_pdf, emit_midi, use_cache)
     print("All scales generated and compiled successfully.")
 
+def generate_many(keys, octaves, emit_pdf=True, emit_midi=True, use_cache=True, use_tmpfs=False):
+    """
+    Generates and compiles practice scales for several keys at once, one
+    file per key (e.g. 'fsharp_practice.ly'). Keys that share a file name
+    ('f#' and 'F#') are generated once. All files are written first;
+    they are then split into one batch per CPU core and each batch is
+    compiled by a single LilyPond process, so startup is paid once per core
+    rather than once per key. The batches run in a thread pool, since each
+    worker just waits on its subprocess.
+
+    Args:
+        keys (list): The root notes to generate (e.g., ['c', 'g', 'f#']).
+        octaves (int): The number of octaves to generate (1 to 4).
+        emit_pdf (bool): Typeset the scales into PDFs.
+        emit_midi (bool): Render the scales into MIDI.
+        use_cache (bool): Reuse and record builds in LILYPOND_BUILD_CACHE.
+        use_tmpfs (bool): Compile in RAM-backed temporary directories and
+            move the finished PDF/MIDI files into place.
+
+    Raises:
+        SystemExit: If any errors occur during file operations or compilation.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    validate_octaves(octaves)
+    validate_outputs(emit_pdf, emit_midi)
+
+    # File name -> key, keeping the first key for each name so no two
+    # batches compile the same file concurrently.
+    files = {}
+    for k in keys:
+        files.setdefault(f"{k.lower().replace('#', 'sharp')}_practice.ly", k)
+
+    lilypond_version = get_lilypond_version()
+    ly_filenames = []
+    for ly_filename, k in files.items():
+        delete_existing_files(get_output_filenames(ly_filename))
+        write_lilypond_combined(ly_filename, [k], SCALE_TYPES, octaves, lilypond_version,
+                                emit_pdf, emit_midi)
+        ly_filenames.append(ly_filename)
+
+    workers = min(len(ly_filenames), os.cpu_count() or 1)
+    batches = [ly_filenames[i::workers] for i in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        compile_batch = functools.partial(compile_lilypond, use_tmpfs=use_tmpfs, use_cache=use_cache,
+                                          emit_pdf=emit_pdf)
+        list(executor.map(compile_batch, batches))
+
 # Example usage (uncomment to run directly):
 if __name__ == "__main__":
     key_input = "f#"   # Try 'a', 'c', 'f#', 'eb', etc.